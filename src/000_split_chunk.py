@@ -1,14 +1,27 @@
 # Version 1.11
+import io
 import os
+import csv
 import glob
+import heapq
+import json
 import time
+import shutil
 import logging
+import argparse
+import tempfile
 import pandas as pd
 from datetime import datetime
 from dotenv import load_dotenv
 from multiprocessing import Pool
 from pyspark.sql import SparkSession
 import polars as pl
+from loadutils import INDEX_INTERVAL, NULL_MARKER, UNKNOWN_PARTITION, RecordIndex, WorkerProfiler, check_cluster_key
+
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%Y%m%d", "%d/%m/%Y", "%d-%m-%Y"]  # Tried in order when the schema gives no format
+DATETIME_FORMATS = [date_format + time_format for date_format in DATE_FORMATS for time_format in [" %H:%M:%S", "T%H:%M:%S", " %H:%M:%S%.f", "T%H:%M:%S%.f", " %H:%M"]]
+QUARANTINE_SAMPLES = 5  # Unparseable values quoted in the log per column and chunk
+NUMERIC_TYPES = ("TINYINT", "SMALLINT", "MEDIUMINT", "INT", "INTEGER", "BIGINT", "DECIMAL", "FLOAT", "DOUBLE", "BOOL", "BOOLEAN")
 
 # Define a Configuration class to store environment variables
 class Config:
@@ -18,14 +31,31 @@ class Config:
         self.input_directory = os.getenv("indir")
         self.output_directory = os.getenv("outdir")
         self.log_dir = os.getenv("logsdir")
+        self.schemadir = os.getenv("schemadir")
+        self.index_directory = os.getenv("indexdir") or os.path.join(self.output_directory, "index")
 
-        # Create output and logs directories if they don't exist
+        # Create output, logs and index directories if they don't exist
         os.makedirs(self.output_directory, exist_ok=True)
         os.makedirs(self.log_dir, exist_ok=True)
+        os.makedirs(self.index_directory, exist_ok=True)
 
         # Get the number of CPU cores available on the system
         self.num_processes = os.cpu_count() or 1  # Use at least 1 process if cpu_count() returns None
         self.chunk_size = 10000 # Default value of chunk size
+        self.partition_batch_size = 100000 # Rows read per batch when splitting by date
+        self.partition_part_size = 1000000 # Maximum rows per part file inside a date partition
+        self.sort_run_size = 1000000 # Rows sorted in memory per run spilled to disk when sorting by the clustering key
+        self.index_interval = INDEX_INTERVAL # Rows between record offsets kept in the index, every chunk size is a multiple of it
+        self.chunk_workers_per_file = 4 # Chunks of one input file written at the same time, each worker holds one chunk in memory
+
+    def get_schema_data(self, base_filename):
+        # Input files are named after the dataset (and may have been lower-cased by autorename.sh)
+        for schema_file in glob.glob(os.path.join(self.schemadir, "*.json")):
+            with open(schema_file, 'r') as f:
+                schema_data = json.load(f)
+            if list(schema_data.keys())[0].lower() == base_filename.lower():
+                return schema_data
+        return None
 
 # Define a Logging class for logging operations
 class DataProcessorLogger:
@@ -51,9 +81,9 @@ class CsvOutputProcessor:
     def __init__(self, outdir):
         self.outdir = outdir
 
-    def process_csv_output(self, csv_file_path, chunk, base_filename, chunk_number):
+    def process_csv_output(self, csv_file_path, chunk, base_filename, chunk_number, na_rep=""):
         try:
-            chunk.to_csv(csv_file_path, index=False, header=True)
+            chunk.to_csv(csv_file_path, index=False, header=True, na_rep=na_rep)
         except Exception as e:
             f"Error writing CSV file for {base_filename}_{chunk_number}: {str(e)}"
 
@@ -62,18 +92,132 @@ class CsvOutputHandler:
     def __init__(self, outdir):
         self.outdir = outdir
 
-    def write_csv(self, csv_file_path, chunk, base_filename, chunk_number):
+    def write_csv(self, csv_file_path, chunk, base_filename, chunk_number, na_rep=""):
         csv_processor = CsvOutputProcessor(self.outdir)
-        csv_processor.process_csv_output(csv_file_path, chunk, base_filename, chunk_number)
+        csv_processor.process_csv_output(csv_file_path, chunk, base_filename, chunk_number, na_rep)
+
+# Define a class for cleaning chunks as configured in the schema's "cleaning" block:
+#   encoding:    charset of the input file, chunks are always written as UTF-8 for utf8mb4 tables
+#   trim:        strip surrounding whitespace from every value
+#   null_values: values turned into NULL (after trimming), e.g. ["", "03003d"]
+#   formats:     strptime format per DATE/DATETIME column, DATE_FORMATS and DATETIME_FORMATS are tried in order when not given
+# Rows holding a date that matches no format are copied, raw and with their source row number, to
+# {quarantine_dir}/rows_{first row of the chunk}.csv, the value itself is loaded as NULL.
+class ChunkCleaner:
+    def __init__(self, schema_data, logger, quarantine_dir):
+        dataset_name = list(schema_data.keys())[0]
+        cleaning = schema_data["cleaning"]
+        self.encoding = cleaning.get("encoding", "utf-8")
+        self.trim = cleaning.get("trim", False)
+        self.null_values = cleaning.get("null_values", [])
+        self.formats = cleaning.get("formats", {})
+        self.column_types = {column: data_type.upper() for column, data_type in schema_data[dataset_name].items()}
+        self.logger = logger
+        self.quarantine_dir = quarantine_dir
+
+    def parse_dates(self, values, column):
+        # A fixed format list, polars would otherwise infer a single format per chunk from its first value.
+        # Each next format only parses the values still unparsed, so a column in one format is parsed once.
+        if column in self.formats:
+            formats = [self.formats[column]]
+        elif self.column_types[column] == "DATE":
+            formats = DATE_FORMATS + DATETIME_FORMATS
+        else:
+            formats = DATETIME_FORMATS + DATE_FORMATS
+        parsed = values.str.to_datetime(formats[0], strict=False, time_unit="us")
+        for date_format in formats[1:]:
+            missing = parsed.is_null() & values.is_not_null()
+            if not missing.any():
+                break
+            parsed = parsed.scatter(missing.arg_true(), values.filter(missing).str.to_datetime(date_format, strict=False, time_unit="us"))
+        return parsed
+
+    def build_expression(self, column):
+        expression = pl.col(column)
+        if self.trim:
+            expression = expression.str.strip_chars()
+        if self.null_values:
+            expression = pl.when(expression.is_in(self.null_values)).then(None).otherwise(expression)
+        return expression.alias(column)
+
+    def clean(self, chunk):
+        df = pl.from_pandas(chunk)
+        cleaned = df.select([self.build_expression(column) for column in df.columns])
+
+        # Values that were present but did not parse as a date end up NULL, log samples and quarantine their rows
+        date_columns = [column for column in df.columns if self.column_types.get(column) in ("DATE", "DATETIME", "TIMESTAMP")]
+        if date_columns:
+            failed_rows = pl.Series([False] * len(df))
+            parsed_columns = []
+            for column in date_columns:
+                raw_values = cleaned[column]
+                parsed = self.parse_dates(raw_values, column)
+                failed = raw_values.is_not_null() & parsed.is_null()
+                if failed.any():
+                    samples = raw_values.filter(failed).unique(maintain_order=True).head(QUARANTINE_SAMPLES).to_list()
+                    self.logger.log_error(f"  {failed.sum()} unparseable value(s) in {column} set to NULL, e.g. {samples}")
+                    failed_rows = failed_rows | failed
+                output_format = "%Y-%m-%d" if self.column_types[column] == "DATE" else "%Y-%m-%d %H:%M:%S"
+                parsed_columns.append(parsed.dt.strftime(output_format).alias(column))
+            cleaned = cleaned.with_columns(parsed_columns)
+            self.quarantine(chunk, failed_rows.to_numpy())
+        return cleaned.to_pandas()
+
+    def quarantine(self, chunk, failed_rows):
+        # The chunk index is the source row number, so every chunk gets its own file and parallel
+        # workers never write to the same one. A clean re-run of the chunk removes its stale file.
+        if not len(chunk):
+            return
+        quarantine_path = os.path.join(self.quarantine_dir, f"rows_{chunk.index[0] + 1}.csv")
+        if not failed_rows.any():
+            if os.path.exists(quarantine_path):
+                os.remove(quarantine_path)
+            return
+        os.makedirs(self.quarantine_dir, exist_ok=True)
+        rejected_rows = chunk[failed_rows]
+        rejected_rows.insert(0, "source_row", rejected_rows.index + 1)
+        rejected_rows.to_csv(quarantine_path, index=False)
+        self.logger.log_error(f"  {len(rejected_rows)} row(s) with unparseable dates copied to {quarantine_path}")
+
+# Define a class for reading a byte range of a file behind its header as one stream, so a chunk
+# is parsed straight from disk without holding its raw bytes next to the DataFrame
+class ByteRangeReader(io.RawIOBase):
+    def __init__(self, path, header, start, end):
+        self.file = open(path, 'rb')
+        self.file.seek(start)
+        self.header = header
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.header:
+            size = min(len(buffer), len(self.header))
+            buffer[:size] = self.header[:size]
+            self.header = self.header[size:]
+            return size
+        if self.remaining <= 0:
+            return 0
+        size = self.file.readinto(memoryview(buffer)[:min(len(buffer), self.remaining)])
+        self.remaining -= size
+        return size
+
+    def close(self):
+        self.file.close()
+        super().close()
 
 # Define a class for processing data
 class BaseFilenameProcessor:
-    def __init__(self, indir, outdir, config, log_dir):
+    def __init__(self, indir, outdir, config, log_dir, layout="rows", profiler=None, sort=False):
         self.indir = indir
         self.outdir = outdir
         self.config = config
         self.chunk_size = Config().chunk_size
         self.log_dir = log_dir
+        self.layout = layout
+        self.profiler = profiler
+        self.sort = sort
 
     def removeExistingFile(self):
         delete_output_file = glob.glob(os.path.join(self.outdir, r"*.csv"))
@@ -99,13 +243,189 @@ class BaseFilenameProcessor:
         csv_file_path = os.path.join(self.outdir, csv_filename)
         return csv_filename, csv_file_path
 
-    def process_chunk(self, input_file):
+    def remove_stale_chunks(self, base_filename, chunk_count, logger):
+        # A previous split of a larger file leaves chunks past the new last one, the loaders, the
+        # reconciliation and the snapshot diff would all pick them up as part of the dataset
+        for csv_file_path in glob.glob(os.path.join(self.outdir, f"{glob.escape(base_filename)}_*.csv")):
+            chunk_suffix = os.path.basename(csv_file_path)[len(base_filename) + 1:-len(".csv")]
+            if chunk_suffix.isdigit() and int(chunk_suffix) > chunk_count:
+                os.remove(csv_file_path)
+                logger.log_info(f"Removed stale chunk file {csv_file_path}")
+
+    def generate_partition_filenames(self, base_filename, partition_key, part_number):
+        # Hive-style layout: {outdir}/{base}/date=YYYY-MM-DD/part-{n}.csv
+        partition_dir = os.path.join(self.outdir, base_filename, f"date={partition_key}")
+        csv_filename = f"part-{part_number}.csv"
+        return partition_dir, os.path.join(partition_dir, csv_filename)
+
+    def generate_output_columns(self, input_file, schema_data, logger):
+        # Kept schema columns in schema order, the order LOAD DATA lists them in. Columns are matched
+        # by header name, so a reordered export still produces chunks in the expected order.
+        if schema_data is None:
+            logger.log_info(f"No schema found for {input_file}, writing all columns as they are.")
+            return None
+        dataset_name = list(schema_data.keys())[0]
+        dropped_columns = set(schema_data.get("drop_columns", []))
+        output_columns = [column for column in schema_data[dataset_name] if column not in dropped_columns]
+
+        encoding = schema_data.get("cleaning", {}).get("encoding", "utf-8")
+        header = pd.read_csv(input_file, nrows=0, encoding=encoding).columns.tolist()
+        missing_columns = [column for column in output_columns if column not in header]
+        if missing_columns:
+            raise ValueError(f"Columns {missing_columns} of schema {dataset_name} are missing from {input_file}")
+        skipped_columns = [column for column in header if column not in output_columns]
+        if skipped_columns:
+            logger.log_info(f"Dropping columns {skipped_columns} from {input_file}")
+        return output_columns
+
+    def generate_read_options(self, cleaner):
+        # Chunks that get cleaned are read as plain text so the cleaner sees every value as it was exported
+        if cleaner is None:
+            return {}
+        return {"dtype": str, "keep_default_na": False, "na_filter": False, "encoding": cleaner.encoding}
+
+    def read_csv_chunks(self, input_file, chunksize, output_columns, cleaner=None):
+        # usecols keeps the parser from materialising dropped columns, the selection puts them in schema order.
+        read_options = self.generate_read_options(cleaner)
+        for chunk in pd.read_csv(input_file, chunksize=chunksize, low_memory=False, usecols=output_columns, **read_options):
+            if output_columns is not None:
+                chunk = chunk[output_columns]
+            yield chunk if cleaner is None else cleaner.clean(chunk)
+
+    def read_csv_range(self, input_file, record_index, first_row, row_count, output_columns, cleaner=None):
+        # Seeks straight to the indexed rows instead of parsing the file up to them
+        start, end = record_index.byte_range(first_row, row_count)
+        read_options = self.generate_read_options(cleaner)
+        with io.BufferedReader(ByteRangeReader(input_file, record_index.header, start, end)) as f:
+            chunk = pd.read_csv(f, low_memory=False, usecols=output_columns, **read_options)
+        # Number the rows from their position in the file, as the streaming reader does
+        chunk.index = pd.RangeIndex(first_row, first_row + len(chunk))
+        if output_columns is not None:
+            chunk = chunk[output_columns]
+        return chunk if cleaner is None else cleaner.clean(chunk)
+
+    def load_record_index(self, input_file):
+        return RecordIndex(input_file, self.config.index_directory, self.config.index_interval).load_or_build()
+
+    def generate_chunk_size(self, total_length):
+        # Determine chunk size based on total length of input_file
+        chunk_size = self.chunk_size
+        if total_length < 10000:
+            chunk_size = 1000
+        elif total_length < 100000:
+            chunk_size = 10000
+        elif total_length < 1000000:
+            chunk_size = 100000
+        elif total_length < 10000000:
+            chunk_size = 1000000
+        elif total_length >= 100000000:
+            chunk_size = 1000000
+        return chunk_size
+
+    def plan_chunks(self, input_file, selected_chunks=None):
+        # Builds (or reuses) the record index and splits the chunks into at most chunk_workers_per_file
+        # runs of consecutive chunks, so a large file is written in parallel with bounded memory
+        logger = DataProcessorLogger(self.config.log_dir)
+        logger.configure_logging()
+        try:
+            record_index = self.load_record_index(input_file)
+        except Exception as e:
+            logger.log_error(f"Error indexing {input_file}: {str(e)}")
+            return []
+        chunk_size = self.generate_chunk_size(record_index.row_count)
+        chunk_count = -(-record_index.row_count // chunk_size)
+        logger.log_info(f"{input_file}: {record_index.row_count} rows in {chunk_count} chunk(s) of {chunk_size} rows")
+        self.remove_stale_chunks(self.generate_base_filename(input_file), chunk_count, logger)
+        chunk_numbers = [chunk_number for chunk_number in range(1, chunk_count + 1) if not selected_chunks or chunk_number in selected_chunks]
+        run_length = max(-(-len(chunk_numbers) // self.config.chunk_workers_per_file), 1)
+        return [(input_file, chunk_numbers[start:start + run_length]) for start in range(0, len(chunk_numbers), run_length)]
+
+    def generate_cleaner(self, schema_data, logger, base_filename):
+        if not schema_data or "cleaning" not in schema_data:
+            return None
+        return ChunkCleaner(schema_data, logger, os.path.join(self.outdir, "quarantine", base_filename))
+
+    def generate_sort_value(self, value, numeric):
+        # NULLs and unparseable numbers sort first, matching na_position="first" in the in-memory sort
+        if value in ("", NULL_MARKER):
+            return (0, 0)
+        if numeric:
+            try:
+                return (1, float(value))
+            except ValueError:
+                return (0, 0)
+        return (1, value)
+
+    def sort_chunks(self, chunks, cluster_by, column_types, na_rep, logger):
+        # External sort: every chunk is sorted in memory and spilled as a run, then the runs are
+        # k-way merged and re-chunked, so memory stays bounded by sort_run_size rows
+        numeric_columns = {column for column in cluster_by if column_types.get(column, "").upper().split("(")[0] in NUMERIC_TYPES}
+        with tempfile.TemporaryDirectory(dir=self.outdir) as run_directory:
+            run_files = []
+            for run_number, chunk in enumerate(chunks, start=1):
+                sort_keys = pd.DataFrame({
+                    column: pd.to_numeric(chunk[column], errors="coerce") if column in numeric_columns else chunk[column].astype("string")
+                    for column in cluster_by
+                })
+                sorted_index = sort_keys.sort_values(cluster_by, na_position="first", kind="stable").index
+                run_file = os.path.join(run_directory, f"run_{run_number}.csv")
+                chunk.loc[sorted_index].to_csv(run_file, index=False, na_rep=na_rep)
+                run_files.append(run_file)
+            logger.log_info(f"Sorted {len(run_files)} run(s) by {cluster_by}, merging")
+
+            run_handles = [open(run_file, 'r', newline="", encoding="utf-8") for run_file in run_files]
+            try:
+                readers = [csv.reader(run_handle) for run_handle in run_handles]
+                headers = [next(reader) for reader in readers]
+                if not headers:
+                    return
+                header = headers[0]
+                sort_positions = [(header.index(column), column in numeric_columns) for column in cluster_by]
+
+                def sort_key(row):
+                    return tuple(self.generate_sort_value(row[position], numeric) for position, numeric in sort_positions)
+
+                rows = []
+                for row in heapq.merge(*readers, key=sort_key):
+                    rows.append(row)
+                    if len(rows) >= self.chunk_size:
+                        yield pd.DataFrame(rows, columns=header)
+                        rows = []
+                if rows:
+                    yield pd.DataFrame(rows, columns=header)
+            finally:
+                for run_handle in run_handles:
+                    run_handle.close()
+
+    def generate_partition_keys(self, values, date_format=None):
+        text = values.astype("string").str.strip()
+        dates = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+        for candidate_format in [date_format] if date_format else DATE_FORMATS:
+            missing = dates.isna() & text.notna()
+            if not missing.any():
+                break
+            # exact=False also accepts a date followed by a time part, e.g. "2023-01-05 08:15:00"
+            dates[missing] = pd.to_datetime(text[missing], format=candidate_format, exact=False, errors="coerce")
+        return dates.dt.strftime("%Y-%m-%d").fillna(UNKNOWN_PARTITION)
+
+    def process_chunk(self, input_file, chunk_numbers=None):
         # Initialize the logger for each process
         logger = DataProcessorLogger(self.config.log_dir)
         logger.configure_logging()
 
         try:
-            self._extracted_from_process_chunk(input_file, logger)
+            name = self.generate_base_filename(input_file)
+            if chunk_numbers is not None:
+                process, args = self._extract_indexed_chunks, (input_file, chunk_numbers, logger)
+                name = f"{name}_{chunk_numbers[0]}"
+            elif self.layout == "date":
+                process, args = self._partition_by_date, (input_file, logger)
+            else:
+                process, args = self._extracted_from_process_chunk, (input_file, logger)
+            if self.profiler is None:
+                process(*args)
+            else:
+                self.profiler.run(name, process, *args)
         except Exception as e:
             logger.log_error(f"Error processing chunks: {str(e)}")
 
@@ -115,35 +435,36 @@ class BaseFilenameProcessor:
 
         total_start_time = time.time()
         csv_row_counts = []
+        schema_data = self.config.get_schema_data(base_filename)
+        output_columns = self.generate_output_columns(input_file, schema_data, logger)
+        cleaner = self.generate_cleaner(schema_data, logger, base_filename)
 
-        # Count total rows of a single CSV file
-        lz_df = pl.scan_csv(input_file, infer_schema_length=100000, null_values=['03003d'])
-        df = lz_df.collect()
-        num_rows = df.shape[0]
+        # Total rows of a single CSV file, read from its record index once that has been built
+        num_rows = self.load_record_index(input_file).row_count
         # print(f"{num_rows}")
 
-        # Determine chunk size based on total length of input_file
-        total_length = num_rows
-        if total_length < 10000:
-            self.chunk_size = 1000
-        elif total_length < 100000:
-            self.chunk_size = 10000
-        elif total_length < 1000000:
-            self.chunk_size = 100000
-        elif total_length < 10000000:
-            self.chunk_size = 1000000
-        elif total_length >= 100000000:
-            self.chunk_size = 1000000
+        self.chunk_size = self.generate_chunk_size(num_rows)
 
         # for chunk_number, chunk in enumerate(pd.read_csv(input_file, chunksize=self.chunk_size, low_memory=False), start=1):
-        for chunk_number, chunk in enumerate(pd.read_csv(input_file, chunksize=self.chunk_size, low_memory=False), start=1):
+        if self.sort:
+            cluster_by = schema_data.get("cluster_by") if schema_data else None
+            if not cluster_by:
+                raise ValueError(f"No schema with a cluster_by key found for {base_filename}")
+            check_cluster_key(schema_data)
+            dataset_name = list(schema_data.keys())[0]
+            runs = self.read_csv_chunks(input_file, self.config.sort_run_size, output_columns, cleaner)
+            chunks = self.sort_chunks(runs, cluster_by, schema_data[dataset_name], NULL_MARKER if cleaner else "", logger)
+        else:
+            chunks = self.read_csv_chunks(input_file, self.chunk_size, output_columns, cleaner)
+
+        for chunk_number, chunk in enumerate(chunks, start=1):
             start_time = time.time()
             csv_filename, csv_file_path = self.generate_output_filenames(base_filename, chunk_number)
             csv_row_count = len(chunk)
             csv_row_counts.append(csv_row_count)
 
             csv_handler = CsvOutputHandler(self.outdir)
-            csv_handler.write_csv(csv_file_path, chunk, base_filename, chunk_number)
+            csv_handler.write_csv(csv_file_path, chunk, base_filename, chunk_number, NULL_MARKER if cleaner else "")
 
             csv_end_time = time.time()
             csv_execution_time = csv_end_time - start_time
@@ -153,20 +474,124 @@ class BaseFilenameProcessor:
             logger.log_info(f"  Execution Time: {csv_execution_time:.6f} seconds")
             logger.log_info(f"  Rows: {csv_row_count} rows")
 
+        self.remove_stale_chunks(base_filename, len(csv_row_counts), logger)
         total_end_time = time.time()
         total_execution_time = total_end_time - total_start_time
         logger.log_info(f"Total Execution Time: {total_execution_time:.6f} seconds\n")
 
+    def _extract_indexed_chunks(self, input_file, chunk_numbers, logger):
+        # Writes every chunk in chunk_numbers exactly as the streaming pass would, reading only its byte range
+        base_filename = self.generate_base_filename(input_file)
+        schema_data = self.config.get_schema_data(base_filename)
+        output_columns = self.generate_output_columns(input_file, schema_data, logger)
+        cleaner = self.generate_cleaner(schema_data, logger, base_filename)
+        record_index = self.load_record_index(input_file)
+        chunk_size = self.generate_chunk_size(record_index.row_count)
+
+        for chunk_number in chunk_numbers:
+            start_time = time.time()
+            chunk = self.read_csv_range(input_file, record_index, (chunk_number - 1) * chunk_size, chunk_size, output_columns, cleaner)
+            csv_filename, csv_file_path = self.generate_output_filenames(base_filename, chunk_number)
+            csv_handler = CsvOutputHandler(self.outdir)
+            csv_handler.write_csv(csv_file_path, chunk, base_filename, chunk_number, NULL_MARKER if cleaner else "")
+            csv_execution_time = time.time() - start_time
+
+            logger.log_info(f"[Batch {chunk_number}]")
+            logger.log_info(f"{csv_filename}:")
+            logger.log_info(f"  Execution Time: {csv_execution_time:.6f} seconds")
+            logger.log_info(f"  Rows: {len(chunk)} rows")
+
+    def _partition_by_date(self, input_file, logger):
+        base_filename = self.generate_base_filename(input_file)
+        schema_data = self.config.get_schema_data(base_filename)
+        partition_by = schema_data.get("partition_by") if schema_data else None
+        if not partition_by:
+            raise ValueError(f"No schema with a partition_by column found for {base_filename}")
+        output_columns = self.generate_output_columns(input_file, schema_data, logger)
+        if partition_by["column"] not in output_columns:
+            raise ValueError(f"Partition column {partition_by['column']} of {base_filename} is listed in drop_columns")
+        cleaner = self.generate_cleaner(schema_data, logger, base_filename)
+        logger.log_info(f"Partitioning input file: {input_file} by {partition_by['column']}")
+
+        total_start_time = time.time()
+        # Rows are appended to the partitions as they stream in, so start from an empty table directory
+        shutil.rmtree(os.path.join(self.outdir, base_filename), ignore_errors=True)
+        parts = {}  # partition key -> [current part number, rows in current part]
+        # The cleaner already rewrote date columns to ISO, the source format in the schema no longer applies
+        partition_format = partition_by.get("format")
+        if cleaner and cleaner.column_types.get(partition_by["column"]) in ("DATE", "DATETIME", "TIMESTAMP"):
+            partition_format = "%Y-%m-%d"
+
+        for batch_number, batch in enumerate(self.read_csv_chunks(input_file, self.config.partition_batch_size, output_columns, cleaner), start=1):
+            start_time = time.time()
+            partition_keys = self.generate_partition_keys(batch[partition_by["column"]], partition_format)
+
+            for partition_key, rows in batch.groupby(partition_keys, sort=False):
+                part = parts.setdefault(partition_key, [1, 0])
+                while len(rows):
+                    if part[1] >= self.config.partition_part_size:
+                        part[0] += 1
+                        part[1] = 0
+                    partition_dir, csv_file_path = self.generate_partition_filenames(base_filename, partition_key, part[0])
+                    os.makedirs(partition_dir, exist_ok=True)
+                    part_rows = rows.iloc[:self.config.partition_part_size - part[1]]
+                    part_rows.to_csv(csv_file_path, mode="a", index=False, header=part[1] == 0, na_rep=NULL_MARKER if cleaner else "")
+                    part[1] += len(part_rows)
+                    rows = rows.iloc[len(part_rows):]
+
+            logger.log_info(f"[Batch {batch_number}] {len(batch)} rows in {time.time() - start_time:.6f} seconds")
+
+        for partition_key in sorted(parts):
+            logger.log_info(f"  date={partition_key}: {parts[partition_key][0]} part file(s)")
+        if UNKNOWN_PARTITION in parts:
+            logger.log_error(f"Rows with an unparseable {partition_by['column']} were written to date={UNKNOWN_PARTITION}")
+
+        total_execution_time = time.time() - total_start_time
+        logger.log_info(f"Total Execution Time: {total_execution_time:.6f} seconds\n")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split input CSV files into load-ready chunks.")
+    parser.add_argument("--layout", choices=["rows", "date"], default="rows",
+                        help="rows: {base}_{n}.csv chunks by row count, date: {base}/date=YYYY-MM-DD/part-{n}.csv by the schema's partition_by column")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run every worker under cProfile and merge the stats into {logsdir}/profile_{timestamp}/profile_report.txt")
+    parser.add_argument("--profile-stacks", action="store_true",
+                        help="With --profile, also sample call stacks into stacks.collapsed for flamegraphs")
+    parser.add_argument("--sort", action="store_true",
+                        help="Order rows by the schema's cluster_by key, a prefix of its primary_key, with a bounded-memory external sort before chunking")
+    parser.add_argument("--chunks", nargs="+", type=int,
+                        help="Only write these chunk numbers of every input file, e.g. to re-extract a chunk that failed to load")
+    args = parser.parse_args()
+    if args.sort and args.layout != "rows":
+        parser.error("--sort requires --layout rows")
+    if args.chunks and (args.sort or args.layout != "rows"):
+        parser.error("--chunks requires --layout rows without --sort")
+
     # Initialize the configuration
     config = Config()
 
+    profiler = None
+    if args.profile:
+        profiler = WorkerProfiler(os.path.join(config.log_dir, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"), args.profile_stacks)
+
     processor = BaseFilenameProcessor(
         config.input_directory,
         config.output_directory,
-        config, config.log_dir)  
+        config, config.log_dir, args.layout, profiler, args.sort)  
     input_files = processor.list_input_files() # Pass the config instance
 
     # Create a Process Pool
     with Pool(processes=config.num_processes) as pool:
-        pool.starmap(processor.process_chunk, [(input_file,) for input_file in input_files])
+        if args.layout == "rows" and not args.sort:
+            # The record indexes give every chunk its byte range, so the chunks of one large file are
+            # written in parallel instead of one worker streaming the whole file
+            chunk_jobs = pool.starmap(processor.plan_chunks, [(input_file, args.chunks) for input_file in input_files])
+            pool.starmap(processor.process_chunk, [job for jobs in chunk_jobs for job in jobs])
+        else:
+            pool.starmap(processor.process_chunk, [(input_file,) for input_file in input_files])
+
+    if profiler is not None:
+        report_path, hot_functions = profiler.merge()
+        print(f"Profile report: {report_path}")
+        for hot_function in hot_functions:
+            print(f"  {hot_function}")
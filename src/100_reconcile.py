@@ -0,0 +1,249 @@
+import os, re, csv, sys, json, glob, zlib, logging, argparse, mysql.connector
+from dotenv import load_dotenv
+from datetime import datetime
+from multiprocessing import Pool
+from loadutils import NULL_MARKER, count_records
+
+FIELD_SEPARATOR = "\x1f"  # Same separator as CHAR(31) in the MySQL checksum query
+INTEGRAL_FLOAT = re.compile(r"^(-?\d+)\.0+$")  # pandas writes nullable integer columns as "1.0"
+
+class Config:
+    def __init__(self):
+        load_dotenv("../.env")
+        self.input_directory = os.getenv("indir")
+        self.output_directory = os.getenv("outdir")
+        self.logsdir = os.getenv("logsdir")
+        self.schemadir = os.getenv("schemadir")
+        # Source row counts come from the record indexes 000_split_chunk.py keeps there
+        self.index_directory = os.getenv("indexdir") or os.path.join(self.output_directory, "index")
+        os.makedirs(self.logsdir, exist_ok=True)
+        self.num_processes = os.cpu_count() or 1
+
+    def get_cleaned_datasets(self):
+        return {dataset_name for dataset_name, schema_data in self.load_schema_files() if "cleaning" in schema_data}
+
+    def load_schema_files(self):
+        for schema_file in sorted(glob.glob(os.path.join(self.schemadir, "*.json"))):
+            with open(schema_file, 'r') as f:
+                schema_data = json.load(f)
+            yield list(schema_data.keys())[0], schema_data
+
+    def get_schemas(self):
+        # Map every dataset name to its ordered list of loaded columns, e.g. {"accident": ["bcc_acc_id", ...]}
+        schemas = {}
+        for dataset_name, schema_data in self.load_schema_files():
+            dropped_columns = set(schema_data.get("drop_columns", []))
+            schemas[dataset_name] = [column for column in schema_data[dataset_name] if column not in dropped_columns]
+        return schemas
+
+class Logger:
+    def __init__(self, logsdir):
+        log_file = f"{logsdir}/log_reconcile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filename=log_file)
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        console_handler.setFormatter(console_formatter)
+        logging.getLogger().addHandler(console_handler)
+
+class Database:
+    def __init__(self):
+        self.mysql_host = os.getenv("mysqlHost")
+        self.mysql_port = os.getenv("mysqlPort")
+        self.mysql_username = os.getenv("mysqlUsername")
+        self.mysql_password = os.getenv("mysqlPassword")
+        self.mysql_database = os.getenv("mysqlDatabase")
+
+    def connect(self):
+        return mysql.connector.connect(
+            host=self.mysql_host,
+            port=self.mysql_port,
+            user=self.mysql_username,
+            password=self.mysql_password,
+            database=self.mysql_database
+        )
+
+# NULL in cleaned chunks is hashed like COALESCE(column, '') on the MySQL side
+def canonical_field(value):
+    if value == NULL_MARKER:
+        return ""
+    match = INTEGRAL_FLOAT.match(value)
+    return match.group(1) if match else value
+
+def row_checksum(fields):
+    row = FIELD_SEPARATOR.join(canonical_field(value) for value in fields)
+    return zlib.crc32(row.encode("utf-8", errors="surrogateescape"))
+
+# Order-independent checksum: the sum of the CRC32 of every row. With a chunk size the rows are
+# bucketed by position, so bucket n of a source file lines up with chunk file n. Fields are picked
+# by header name, so a source carrying dropped or reordered columns hashes like its chunk files.
+def checksum_csv(path, columns, chunk_size=None):
+    buckets = {}
+    with open(path, 'r', newline="", encoding="utf-8", errors="surrogateescape") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = [header.index(column) for column in columns]
+        for index, fields in enumerate(reader):
+            fields = [fields[position] if position < len(fields) else "" for position in positions]
+            bucket = index // chunk_size + 1 if chunk_size else 1
+            records, checksum = buckets.get(bucket, (0, 0))
+            buckets[bucket] = (records + 1, checksum + row_checksum(fields))
+    return buckets
+
+def table_stats(db, table_name, columns, with_checksum):
+    if with_checksum:
+        concat = ", ".join(f"COALESCE({column}, '')" for column in columns)
+        query = f"SELECT COUNT(*), COALESCE(SUM(CRC32(CONCAT_WS(CHAR(31 USING utf8mb4), {concat}))), 0) FROM {table_name}"
+    else:
+        query = f"SELECT COUNT(*), NULL FROM {table_name}"
+    conn = db.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query)
+        records, checksum = cursor.fetchone()
+    finally:
+        conn.close()
+    return int(records), None if checksum is None else int(checksum)
+
+class Reconciler:
+    def __init__(self, config, db, with_checksum=True):
+        self.config = config
+        self.db = db
+        self.with_checksum = with_checksum
+        self.cleaned_datasets = config.get_cleaned_datasets()
+        self.mismatches = 0
+
+    def find_source_file(self, dataset_name):
+        for filename in os.listdir(self.config.input_directory):
+            if filename.lower() == f"{dataset_name.lower()}.csv":
+                return os.path.join(self.config.input_directory, filename)
+        return None
+
+    def find_chunk_files(self, base_filename):
+        pattern = re.compile(rf"^{re.escape(base_filename)}_(\d+)\.csv$")
+        chunk_files = {}
+        for filename in os.listdir(self.config.output_directory):
+            match = pattern.match(filename)
+            if match:
+                chunk_files[int(match.group(1))] = os.path.join(self.config.output_directory, filename)
+        return dict(sorted(chunk_files.items()))
+
+    def find_partition_files(self, base_filename):
+        # Date layout from 000_split_chunk.py --layout date: {outdir}/{base}/date=YYYY-MM-DD/part-{n}.csv
+        table_dir = os.path.join(self.config.output_directory, base_filename)
+        partition_files = glob.glob(os.path.join(table_dir, "date=*", "part-*.csv"))
+        return {os.path.relpath(path, table_dir): path for path in sorted(partition_files)}
+
+    def report(self, label, expected, actual):
+        if expected == actual:
+            logging.info(f"  {label}: OK ({actual})")
+        else:
+            self.mismatches += 1
+            logging.error(f"  {label}: MISMATCH (expected {expected}, got {actual})")
+
+    def reconcile(self, schemas):
+        datasets = {}
+        for dataset_name in schemas:
+            source_file = self.find_source_file(dataset_name)
+            if source_file is None:
+                logging.warning(f"No source file found for {dataset_name}, skipping.")
+                continue
+            base_filename = os.path.splitext(os.path.basename(source_file))[0]
+            chunk_files = self.find_chunk_files(base_filename)
+            partitioned = not chunk_files and os.path.isdir(os.path.join(self.config.output_directory, base_filename))
+            if partitioned:
+                chunk_files = self.find_partition_files(base_filename)
+            datasets[dataset_name] = (source_file, chunk_files, partitioned)
+
+        with Pool(processes=self.config.num_processes) as pool:
+            # Pass 1: quote-aware record counts of every file and the table-side totals
+            count_jobs = {
+                path: pool.apply_async(count_records, (path, self.config.index_directory))
+                for source_file, chunk_files, _ in datasets.values()
+                for path in [source_file, *chunk_files.values()]
+            }
+            table_jobs = {
+                dataset_name: pool.apply_async(table_stats, (self.db, dataset_name, schemas[dataset_name], self.with_checksum))
+                for dataset_name in datasets
+            }
+            counts = {path: job.get() for path, job in count_jobs.items()}
+
+            # Pass 2: per-chunk checksums, with the source bucketed by the size of the first chunk
+            checksum_jobs = {}
+            if self.with_checksum:
+                for dataset_name, (source_file, chunk_files, partitioned) in datasets.items():
+                    columns = schemas[dataset_name]
+                    chunk_size = counts[chunk_files[1]] if not partitioned and 1 in chunk_files and len(chunk_files) > 1 else None
+                    checksum_jobs[source_file] = pool.apply_async(checksum_csv, (source_file, columns, chunk_size))
+                    for chunk_file in chunk_files.values():
+                        checksum_jobs[chunk_file] = pool.apply_async(checksum_csv, (chunk_file, columns))
+            checksums = {path: job.get() for path, job in checksum_jobs.items()}
+
+            for dataset_name, (source_file, chunk_files, partitioned) in datasets.items():
+                self.reconcile_dataset(dataset_name, source_file, chunk_files, partitioned, counts, checksums, table_jobs[dataset_name])
+
+        return self.mismatches
+
+    def reconcile_dataset(self, dataset_name, source_file, chunk_files, partitioned, counts, checksums, table_job):
+        print("\n")
+        logging.info(f"[[ {dataset_name.upper()} ]]")
+        source_records = counts[source_file]
+        logging.info(f"Source {source_file}: {source_records} rows")
+        self.report("Rows in chunk files", source_records, sum(counts[path] for path in chunk_files.values()))
+        # Cleaning rewrites values on the way to the chunks, so chunks only match the source row for row
+        # and the table checksum is checked against the chunks instead
+        cleaned = dataset_name in self.cleaned_datasets
+
+        if partitioned:
+            # Rows are regrouped by date, so only the totals over all partition files line up with the source
+            if self.with_checksum and not cleaned:
+                actual = (sum(checksums[path][1][0] for path in chunk_files.values() if checksums[path]),
+                          sum(checksums[path][1][1] for path in chunk_files.values() if checksums[path]))
+                self.report("Partition files (rows, checksum)", checksums[source_file].get(1, (0, 0)), actual)
+        elif self.with_checksum:
+            expected = checksums[source_file]
+            for chunk_number in sorted(set(expected) | set(chunk_files)):
+                if chunk_number not in chunk_files:
+                    self.report(f"Chunk {chunk_number}", expected[chunk_number], "missing chunk file")
+                    continue
+                actual = checksums[chunk_files[chunk_number]].get(1, (0, 0))
+                if cleaned:
+                    self.report(f"Chunk {chunk_number} rows", expected.get(chunk_number, (0, 0))[0], actual[0])
+                else:
+                    self.report(f"Chunk {chunk_number} (rows, checksum)", expected.get(chunk_number, (0, 0)), actual)
+        else:
+            chunk_size = counts[chunk_files[1]] if 1 in chunk_files else 0
+            last_chunk = max(chunk_files, default=0)
+            for chunk_number, path in chunk_files.items():
+                if chunk_number != last_chunk:
+                    self.report(f"Chunk {chunk_number} rows", chunk_size, counts[path])
+
+        try:
+            table_records, table_checksum = table_job.get()
+        except mysql.connector.Error as error:
+            self.mismatches += 1
+            logging.error(f"  Could not read table {dataset_name}: {error}")
+        else:
+            self.report(f"Rows in table {dataset_name}", source_records, table_records)
+            if self.with_checksum:
+                checksum_files = chunk_files.values() if cleaned else [source_file]
+                expected_checksum = sum(checksum for path in checksum_files for _, checksum in checksums[path].values())
+                self.report(f"Checksum of table {dataset_name}", expected_checksum, table_checksum)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile source files, chunk files and MySQL tables.")
+    parser.add_argument("--count-only", action="store_true", help="Compare record counts only, skip the checksum pass.")
+    args = parser.parse_args()
+
+    config = Config()
+    logger = Logger(config.logsdir)
+    db = Database()
+
+    reconciler = Reconciler(config, db, with_checksum=not args.count_only)
+    mismatches = reconciler.reconcile(config.get_schemas())
+
+    print("\n")
+    if mismatches:
+        logging.error(f"Reconciliation finished with {mismatches} mismatch(es).")
+        sys.exit(1)
+    logging.info("Reconciliation finished, everything matches.")
@@ -0,0 +1,278 @@
+import os, csv, glob, json, heapq, hashlib, logging, argparse, tempfile, mysql.connector
+from dotenv import load_dotenv
+from datetime import datetime
+from loadutils import LOAD_ENGINES, LOCAL_INFILE_ERRNOS, generate_insert_query, get_key_columns, read_csv_batches, select_load_engine
+
+HASH_RUN_SIZE = 1000000  # Key/hash pairs sorted in memory before a run is spilled to disk
+DELETE_BATCH_SIZE = 1000  # Keys per DELETE ... WHERE (key columns) IN (...) statement
+FIELD_SEPARATOR = "\x1f"
+
+class Config:
+    def __init__(self):
+        load_dotenv("../.env")
+        self.output_directory = os.getenv("outdir")
+        self.logsdir = os.getenv("logsdir")
+        self.schemadir = os.getenv("schemadir")
+        self.snapshot_directory = os.getenv("snapshotdir") or os.path.join(self.output_directory, "snapshots")
+        # Same loadEngine setting as the loaders, the changed rows go in with INSERTs when LOCAL INFILE is off
+        self.load_engine = os.getenv("loadEngine", "auto")
+        self.insert_batch_rows = int(os.getenv("insertBatchRows", "5000"))
+        if self.load_engine not in LOAD_ENGINES:
+            raise ValueError(f"Unknown load engine '{self.load_engine}', expected one of {list(LOAD_ENGINES)}")
+        os.makedirs(self.logsdir, exist_ok=True)
+        os.makedirs(self.snapshot_directory, exist_ok=True)
+
+    def get_snapshot_schemas(self):
+        # Only datasets whose schema declares a primary_key can be diffed
+        schemas = {}
+        for schema_file in sorted(glob.glob(os.path.join(self.schemadir, "*.json"))):
+            with open(schema_file, 'r') as f:
+                schema_data = json.load(f)
+            if "primary_key" in schema_data:
+                schemas[list(schema_data.keys())[0]] = schema_data
+        return schemas
+
+class Logger:
+    def __init__(self, logsdir):
+        log_file = f"{logsdir}/log_snapshot_diff_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filename=log_file)
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        console_handler.setFormatter(console_formatter)
+        logging.getLogger().addHandler(console_handler)
+
+class Database:
+    def __init__(self):
+        self.mysql_host = os.getenv("mysqlHost")
+        self.mysql_port = os.getenv("mysqlPort")
+        self.mysql_username = os.getenv("mysqlUsername")
+        self.mysql_password = os.getenv("mysqlPassword")
+        self.mysql_database = os.getenv("mysqlDatabase")
+
+    def connect(self):
+        return mysql.connector.connect(
+            host=self.mysql_host,
+            port=self.mysql_port,
+            user=self.mysql_username,
+            password=self.mysql_password,
+            database=self.mysql_database,
+            allow_local_infile=True
+        )
+
+def row_hash(fields):
+    row = FIELD_SEPARATOR.join(fields)
+    return hashlib.blake2b(row.encode("utf-8", errors="surrogateescape"), digest_size=8).hexdigest()
+
+# Hash files hold one "key<TAB>hash" line per row, sorted by key
+def read_hash_file(path):
+    with open(path, 'r', encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            key, hash_value = line.rstrip("\n").split("\t")
+            yield key, hash_value
+
+class SnapshotDiff:
+    def __init__(self, config, db, dataset_name, schema_data):
+        self.config = config
+        self.db = db
+        self.table_name = dataset_name
+        self.key_columns = get_key_columns(schema_data)
+        self.previous_hash_file = os.path.join(config.snapshot_directory, f"{dataset_name}.hash")
+        self.current_hash_file = os.path.join(config.snapshot_directory, f"{dataset_name}.hash.new")
+        self.changes_file = os.path.join(config.snapshot_directory, f"{dataset_name}_changes.csv")
+
+    def list_chunk_files(self):
+        # Works on the load-ready rows layout ({table}_{n}.csv), so the changed rows load like any chunk
+        chunk_files = [
+            path for path in glob.glob(os.path.join(self.config.output_directory, f"{self.table_name}_*.csv"))
+            if os.path.splitext(path)[0].rsplit("_", 1)[-1].isdigit()
+        ]
+        if not chunk_files:
+            raise ValueError(f"No {self.table_name}_{{n}}.csv chunks in {self.config.output_directory}, run 000_split_chunk.py --layout rows first")
+        return sorted(chunk_files)
+
+    def generate_key(self, values):
+        # A single column key is stored as is, a composite key as a JSON array, which quotes every value
+        # and escapes tabs and newlines, so no separator inside the data can make two keys collide
+        if len(values) == 1:
+            return values[0]
+        return json.dumps(values, ensure_ascii=False)
+
+    def split_key(self, key):
+        return [key] if len(self.key_columns) == 1 else json.loads(key)
+
+    def iter_rows(self):
+        for chunk_file in self.list_chunk_files():
+            with open(chunk_file, 'r', newline="", encoding="utf-8", errors="surrogateescape") as f:
+                reader = csv.reader(f)
+                header = next(reader)
+                key_positions = [header.index(column) for column in self.key_columns]
+                for fields in reader:
+                    yield header, self.generate_key([fields[position] for position in key_positions]), fields
+
+    def write_sorted_hashes(self):
+        # External sort: sorted runs of HASH_RUN_SIZE pairs are spilled to disk, then k-way merged
+        with tempfile.TemporaryDirectory(dir=self.config.snapshot_directory) as run_directory:
+            run_files = []
+            run = []
+            for _, key, fields in self.iter_rows():
+                run.append((key, row_hash(fields)))
+                if len(run) >= HASH_RUN_SIZE:
+                    run_files.append(self.write_run(run_directory, len(run_files), run))
+                    run = []
+            if run:
+                run_files.append(self.write_run(run_directory, len(run_files), run))
+
+            rows = 0
+            previous_key = None
+            with open(self.current_hash_file, 'w', encoding="utf-8", errors="surrogateescape") as f:
+                for key, hash_value in heapq.merge(*(read_hash_file(run_file) for run_file in run_files)):
+                    if key == previous_key:
+                        raise ValueError(f"Duplicate {', '.join(self.key_columns)} {key} in {self.table_name} snapshot")
+                    f.write(f"{key}\t{hash_value}\n")
+                    previous_key = key
+                    rows += 1
+        logging.info(f"Hashed {rows} rows of {self.table_name} in {len(run_files)} sorted run(s).")
+
+    def write_run(self, run_directory, run_number, run):
+        run.sort()
+        run_file = os.path.join(run_directory, f"run_{run_number}.hash")
+        with open(run_file, 'w', encoding="utf-8", errors="surrogateescape") as f:
+            f.writelines(f"{key}\t{hash_value}\n" for key, hash_value in run)
+        return run_file
+
+    def diff(self):
+        # Merge join of the previous and current hash files, both sorted by key
+        inserts, updates, deletes = [], [], []
+        previous_rows = read_hash_file(self.previous_hash_file)
+        current_rows = read_hash_file(self.current_hash_file)
+        previous = next(previous_rows, None)
+        current = next(current_rows, None)
+        while previous is not None or current is not None:
+            if current is None or (previous is not None and previous[0] < current[0]):
+                deletes.append(previous[0])
+                previous = next(previous_rows, None)
+            elif previous is None or current[0] < previous[0]:
+                inserts.append(current[0])
+                current = next(current_rows, None)
+            else:
+                if previous[1] != current[1]:
+                    updates.append(current[0])
+                previous = next(previous_rows, None)
+                current = next(current_rows, None)
+        return inserts, updates, deletes
+
+    def read_header(self):
+        # Every chunk file carries the same header, the first one has it even when no rows are left
+        with open(self.list_chunk_files()[0], 'r', newline="", encoding="utf-8", errors="surrogateescape") as f:
+            return next(csv.reader(f))
+
+    def write_changes(self, changed_keys):
+        written_rows = 0
+        header = self.read_header()
+        with open(self.changes_file, 'w', newline="", encoding="utf-8", errors="surrogateescape") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(header)
+            for _, key, fields in self.iter_rows():
+                if key in changed_keys:
+                    writer.writerow(fields)
+                    written_rows += 1
+        return header, written_rows
+
+    def apply(self, header, removed_keys):
+        try:
+            conn = self.db.connect()
+            cursor = conn.cursor()
+            deleted_rows = 0
+            for start in range(0, len(removed_keys), DELETE_BATCH_SIZE):
+                batch = removed_keys[start:start + DELETE_BATCH_SIZE]
+                row_placeholder = f"({', '.join(['%s'] * len(self.key_columns))})"
+                placeholders = ', '.join([row_placeholder] * len(batch))
+                key_values = [value for key in batch for value in self.split_key(key)]
+                cursor.execute(f"DELETE FROM {self.table_name} WHERE ({', '.join(self.key_columns)}) IN ({placeholders})", key_values)
+                deleted_rows += cursor.rowcount
+            logging.info(f"Deleted {deleted_rows} changed or removed rows from {self.table_name}.")
+
+            engine = select_load_engine(cursor, self.config.load_engine)
+            if engine == "infile":
+                inserted_rows = self.load_changes(cursor, header)
+                if inserted_rows is None:
+                    engine = "insert"
+            if engine == "insert":
+                # Same connection and transaction as the DELETEs, so the diff still commits as a whole
+                inserted_rows = 0
+                insert_query = generate_insert_query(self.table_name, header)
+                for batch in read_csv_batches(self.changes_file, self.config.insert_batch_rows):
+                    cursor.executemany(insert_query, batch)
+                    inserted_rows += cursor.rowcount
+            logging.info(f"Inserted {inserted_rows} new or changed rows into {self.table_name} with {engine}.")
+            conn.commit()
+            logging.info("Changes committed to the database.")
+            conn.close()
+        except mysql.connector.Error as error:
+            logging.error(f"An error occurred while applying the snapshot diff: {error}")
+            raise
+
+    def load_changes(self, cursor, header):
+        # Returns None when LOAD DATA LOCAL is rejected and loadEngine is "auto"
+        changes_file_path = self.changes_file.replace('\\', '\\\\')
+        load_data_query = f"""
+        LOAD DATA LOCAL INFILE '{changes_file_path}'
+        INTO TABLE {self.table_name}
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY ','
+        OPTIONALLY ENCLOSED BY '"'
+        LINES TERMINATED BY '\\n'
+        IGNORE 1 LINES
+        (
+            {', '.join(header)}
+        )
+        """
+        try:
+            cursor.execute(load_data_query)
+        except mysql.connector.Error as error:
+            if self.config.load_engine != "auto" or error.errno not in LOCAL_INFILE_ERRNOS:
+                raise
+            logging.warning(f"LOAD DATA LOCAL INFILE was rejected ({error}), inserting the changed rows with batched INSERTs.")
+            return None
+        return cursor.rowcount
+
+    def run(self, dry_run=False):
+        print("\n")
+        logging.info(f"[[ {self.table_name.upper()} ]]")
+        self.write_sorted_hashes()
+
+        if not os.path.exists(self.previous_hash_file):
+            # The first snapshot is only recorded, the table is expected to be fully loaded from the same chunks
+            os.replace(self.current_hash_file, self.previous_hash_file)
+            logging.info(f"No previous snapshot of {self.table_name}, recorded {self.previous_hash_file} as the baseline.")
+            return
+
+        inserts, updates, deletes = self.diff()
+        logging.info(f"{len(inserts)} inserts, {len(updates)} updates, {len(deletes)} deletes.")
+        if dry_run:
+            os.remove(self.current_hash_file)
+            return
+
+        if inserts or updates or deletes:
+            header, written_rows = self.write_changes(set(inserts) | set(updates))
+            logging.info(f"Wrote {written_rows} changed rows to {self.changes_file}.")
+            self.apply(header, updates + deletes)
+        # The new snapshot only becomes the baseline once its changes are in the table
+        os.replace(self.current_hash_file, self.previous_hash_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply only the rows that changed since the previous full snapshot.")
+    parser.add_argument("--datasets", nargs="+", help="Datasets to diff, defaults to every schema with a primary_key")
+    parser.add_argument("--dry-run", action="store_true", help="Report insert, update and delete counts without touching MySQL")
+    args = parser.parse_args()
+
+    config = Config()
+    logger = Logger(config.logsdir)
+    db = Database()
+
+    schemas = config.get_snapshot_schemas()
+    for dataset_name in args.datasets or schemas:
+        if dataset_name not in schemas:
+            raise ValueError(f"Schema for {dataset_name} has no primary_key")
+        SnapshotDiff(config, db, dataset_name, schemas[dataset_name]).run(args.dry_run)
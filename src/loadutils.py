@@ -0,0 +1,705 @@
+import os, csv, sys, glob, json, mmap, time, pstats, logging, argparse, cProfile, threading, mysql.connector
+from array import array
+from dotenv import load_dotenv
+from datetime import datetime
+from multiprocessing import get_context
+from itertools import accumulate
+
+# Shared by 000_split_chunk.py, the 00n loaders, 100_reconcile.py and 101_snapshot_diff.py, which import it from the src directory.
+
+UNKNOWN_PARTITION = "__HIVE_DEFAULT_PARTITION__"  # Partition for rows whose date cannot be parsed
+NULL_MARKER = "\\N"  # How cleaned chunks write NULL, LOAD DATA reads it back as NULL
+
+# Tables loaded from the date layout ({outdir}/{table}/date=YYYY-MM-DD/part-n.csv) get an extra column,
+# filled from the directory name, that the table is LIST partitioned on (one MySQL partition per date).
+PARTITION_COLUMN = "partition_date"
+
+INDEX_BLOCK_SIZE = 64 * 1024 * 1024  # Bytes scanned per mmap slice while building a record index
+INDEX_INTERVAL = 1000  # Rows between the record offsets kept in a record index
+
+# Named bulk-load profiles, selected with bulkLoadProfile in .env ("default" when unset).
+#   session:       session variables set for the load and restored afterwards
+#   commit_rows:   None commits once at the end, 0 after every chunk, N once N rows are pending
+#   defer_indexes: create the secondary indexes from the schema "indexes" block after the load
+BULK_LOAD_PROFILES = {
+    "default": {"session": {}, "commit_rows": None, "defer_indexes": False},
+    "bulk": {"session": {"unique_checks": 0, "foreign_key_checks": 0}, "commit_rows": 0, "defer_indexes": True},
+    # Also keeps the load out of the binary log, so replicas never see it. Only for standalone servers.
+    "bulk_no_binlog": {"session": {"unique_checks": 0, "foreign_key_checks": 0, "sql_log_bin": 0}, "commit_rows": 0, "defer_indexes": True},
+}
+
+# loadEngine in .env: "infile" uses LOAD DATA LOCAL INFILE, "insert" batched multi-row INSERTs over
+# insertConnections connections, "auto" uses INFILE unless the server disables or rejects it.
+LOAD_ENGINES = ("auto", "infile", "insert")
+LOCAL_INFILE_ERRNOS = (1148, 2068, 3948)  # Errors raised when LOAD DATA LOCAL is not allowed
+
+class BulkLoadSession:
+    def __init__(self, cursor, profile):
+        self.cursor = cursor
+        self.profile = profile
+        self.saved_variables = {}
+
+    def apply(self):
+        for variable, value in self.profile["session"].items():
+            try:
+                self.cursor.execute(f"SELECT @@SESSION.{variable}")
+                original_value = self.cursor.fetchone()[0]
+                self.cursor.execute(f"SET SESSION {variable} = {value}")
+                self.saved_variables[variable] = original_value
+                logging.info(f"Session variable {variable} set to {value} (was {original_value}).")
+            except mysql.connector.Error as error:
+                # sql_log_bin needs SUPER or SYSTEM_VARIABLES_ADMIN, carry on without it
+                logging.warning(f"Could not set session variable {variable}: {error}")
+
+    def restore(self):
+        for variable, original_value in self.saved_variables.items():
+            self.cursor.execute(f"SET SESSION {variable} = {original_value}")
+            logging.info(f"Session variable {variable} restored to {original_value}.")
+
+def select_load_engine(cursor, engine):
+    # "auto" loads with INSERTs when local_infile is switched off on the server
+    if engine != "auto":
+        return engine
+    cursor.execute("SELECT @@GLOBAL.local_infile")
+    if not int(cursor.fetchone()[0]):
+        logging.warning("local_infile is disabled on the server, loading with batched INSERTs.")
+        return "insert"
+    return "infile"
+
+def generate_insert_query(table_name, columns, partition_name=None):
+    partition_clause = f" PARTITION ({partition_name})" if partition_name else ""
+    insert_columns = columns + [PARTITION_COLUMN] if partition_name else columns
+    # IGNORE matches LOAD DATA LOCAL, which turns conversion errors and duplicate keys into warnings
+    return f"INSERT IGNORE INTO {table_name}{partition_clause} ({', '.join(insert_columns)}) VALUES ({', '.join(['%s'] * len(insert_columns))})"
+
+def read_csv_batches(csv_file_path, batch_rows, extra_values=()):
+    # Rows of a chunk file as INSERT parameters, \N becomes NULL and extra_values are appended to every row
+    with open(csv_file_path, 'r', newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        batch = []
+        for fields in reader:
+            batch.append([None if value == NULL_MARKER else value for value in fields] + list(extra_values))
+            if len(batch) >= batch_rows:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+def insert_chunk_file(task):
+    # Runs in a pool worker, under the parent's WorkerProfiler when the load is profiled
+    db, table_name, columns, csv_file_path, partition_name, partition_value, profile, batch_rows, profiler = task
+    args = (db, table_name, columns, csv_file_path, partition_name, partition_value, profile, batch_rows)
+    if profiler is None:
+        return insert_rows(*args)
+    return profiler.run(f"{table_name}_insert_{os.path.splitext(os.path.basename(csv_file_path))[0]}", insert_rows, *args)
+
+def insert_rows(db, table_name, columns, csv_file_path, partition_name, partition_value, profile, batch_rows):
+    # Own connection, commits after every batch
+    insert_query = generate_insert_query(table_name, columns, partition_name)
+    conn = db.connect()
+    cursor = conn.cursor()
+    session = BulkLoadSession(cursor, profile)
+    session.apply()
+    row_count = 0
+    rows_read = 0
+    batches = 0
+    try:
+        for batch in read_csv_batches(csv_file_path, batch_rows, [partition_value] if partition_name else []):
+            # executemany sends the whole batch as one multi-row INSERT
+            cursor.executemany(insert_query, batch)
+            conn.commit()
+            row_count += cursor.rowcount
+            rows_read += len(batch)
+            batches += 1
+    finally:
+        session.restore()
+        conn.close()
+    return row_count, batches, rows_read
+
+def get_key_columns(schema_data):
+    # primary_key names one column, or several separated by commas
+    return [column.strip() for column in schema_data.get("primary_key", "").split(",") if column.strip()]
+
+def check_cluster_key(schema_data):
+    # Sorting by cluster_by only helps InnoDB when it is a prefix of the primary key the rows are clustered on
+    cluster_by = schema_data.get("cluster_by")
+    key_columns = get_key_columns(schema_data)
+    if cluster_by and cluster_by != key_columns[:len(cluster_by)]:
+        raise ValueError(f"cluster_by {cluster_by} of schema {list(schema_data.keys())[0]} is not a prefix of its primary_key {key_columns}")
+
+# Define a class for the sidecar index of an input file: header, row count and the byte offset of
+# every interval-th record. It is built once by 000_split_chunk.py with a quote-aware mmap scan (a
+# newline inside a quoted field does not end a record) and reused until the file's size or mtime changes.
+# Index file: one JSON metadata line followed by the offsets as a native-endian array of uint64.
+class RecordIndex:
+    def __init__(self, input_file, index_dir, interval):
+        self.input_file = input_file
+        self.index_path = os.path.join(index_dir, f"{os.path.splitext(os.path.basename(input_file))[0]}.idx") if index_dir else None
+        self.interval = interval
+        self.header = b""
+        self.row_count = 0
+        self.data_end = 0
+        self.offsets = array("Q")
+
+    def load_or_build(self):
+        source = os.stat(self.input_file)
+        if self.load(source):
+            logging.info(f"Reusing record index {self.index_path}: {self.row_count} rows")
+            return self
+        start_time = time.time()
+        self.build()
+        self.save(source)
+        logging.info(f"Built record index {self.index_path}: {self.row_count} rows in {time.time() - start_time:.6f} seconds")
+        return self
+
+    def load(self, source):
+        if self.index_path is None or not os.path.exists(self.index_path):
+            return False
+        with open(self.index_path, 'rb') as f:
+            metadata = json.loads(f.readline())
+            if (metadata["source_size"], metadata["source_mtime_ns"], metadata["interval"]) != (source.st_size, source.st_mtime_ns, self.interval):
+                return False
+            self.offsets = array("Q")
+            self.offsets.frombytes(f.read())
+        # latin-1 maps every byte to one character, so the raw header bytes survive the JSON round trip
+        self.header = metadata["header"].encode("latin-1")
+        self.row_count = metadata["row_count"]
+        self.data_end = source.st_size
+        return True
+
+    def save(self, source):
+        metadata = {
+            "source_size": source.st_size,
+            "source_mtime_ns": source.st_mtime_ns,
+            "interval": self.interval,
+            "header": self.header.decode("latin-1"),
+            "row_count": self.row_count,
+        }
+        # Written under a temporary name first, so a reader never sees a half-written index
+        temporary_path = f"{self.index_path}.tmp{os.getpid()}"
+        with open(temporary_path, 'wb') as f:
+            f.write(json.dumps(metadata).encode("utf-8") + b"\n")
+            self.offsets.tofile(f)
+        os.replace(temporary_path, self.index_path)
+
+    def build(self, keep_offsets=True):
+        # terminators counts the newlines that end a record, the first one ends the header. The record
+        # after terminator t is data row t - 1, so its offset is kept when (t - 1) % interval == 0.
+        # Without keep_offsets only the rows are counted, which is all a plain record count needs.
+        self.offsets = array("Q")
+        terminators = 0
+        in_quotes = False
+        with open(self.input_file, "rb") as f:
+            self.data_end = os.fstat(f.fileno()).st_size
+            if self.data_end == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                header_end = mm.find(b"\n")
+                self.header = mm[:header_end + 1] if header_end >= 0 else mm[:]
+                for block_start in range(0, len(mm), INDEX_BLOCK_SIZE):
+                    block = mm[block_start:block_start + INDEX_BLOCK_SIZE]
+                    quote_free = not in_quotes and b'"' not in block
+                    if quote_free and not keep_offsets:
+                        terminators += block.count(b"\n")
+                        continue
+                    pieces = block.split(b"\n")
+                    if quote_free:
+                        # Every newline ends a record, so the record offsets follow from the running piece lengths
+                        ends = list(accumulate(map(len, pieces[:-1])))
+                        for k in range((-terminators) % self.interval, len(ends), self.interval):
+                            self.offsets.append(block_start + ends[k] + k + 1)
+                        terminators += len(ends)
+                        continue
+                    position = block_start
+                    for piece in pieces[:-1]:
+                        position += len(piece) + 1
+                        if piece.count(b'"') & 1:
+                            in_quotes = not in_quotes
+                        if not in_quotes:
+                            if keep_offsets and terminators % self.interval == 0:
+                                self.offsets.append(position)
+                            terminators += 1
+                    if pieces[-1].count(b'"') & 1:
+                        in_quotes = not in_quotes
+                trailing_newline = mm[len(mm) - 1:] == b"\n"
+        # The newline ending the file does not start a record
+        if self.offsets and self.offsets[-1] >= self.data_end:
+            self.offsets.pop()
+        self.row_count = max(terminators - 1 + (0 if trailing_newline else 1), 0)
+
+    def byte_range(self, first_row, row_count):
+        # Bytes [start, end) holding rows first_row .. first_row + row_count - 1, both ends on indexed records
+        last_row = first_row + row_count
+        if first_row % self.interval or first_row >= self.row_count:
+            raise ValueError(f"Row {first_row} of {self.input_file} is not an indexed record")
+        if last_row >= self.row_count:
+            return self.offsets[first_row // self.interval], self.data_end
+        if last_row % self.interval:
+            raise ValueError(f"Row {last_row} of {self.input_file} is not an indexed record")
+        return self.offsets[first_row // self.interval], self.offsets[last_row // self.interval]
+
+def count_records(path, index_dir=None):
+    # Data rows of a CSV file, read from its record index while that is fresh, otherwise counted by a scan
+    record_index = RecordIndex(path, index_dir, INDEX_INTERVAL)
+    if not record_index.load(os.stat(path)):
+        record_index.build(keep_offsets=False)
+    return record_index.row_count
+
+# Define a class for sampling the call stack of a worker thread
+class StackSampler:
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})")
+                frame = frame.f_back
+            collapsed = ";".join(reversed(stack))
+            self.counts[collapsed] = self.counts.get(collapsed, 0) + 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+# Define a class for profiling pool workers
+class WorkerProfiler:
+    def __init__(self, profile_dir, collect_stacks=False, interval=0.005):
+        self.profile_dir = profile_dir
+        self.collect_stacks = collect_stacks
+        self.interval = interval
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+    def run(self, name, function, *args):
+        # Each worker writes its own cProfile stats (and sampled stacks), merge() combines them afterwards
+        output_path = os.path.join(self.profile_dir, f"{name}_{os.getpid()}")
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident(), self.interval) if self.collect_stacks else None
+        if sampler:
+            sampler.start()
+        try:
+            return profiler.runcall(function, *args)
+        finally:
+            profiler.dump_stats(f"{output_path}.prof")
+            if sampler:
+                sampler.stop()
+                with open(f"{output_path}.collapsed", 'w') as f:
+                    f.writelines(f"{stack} {count}\n" for stack, count in sampler.counts.items())
+
+    def merge(self, top=30):
+        stats_files = glob.glob(os.path.join(self.profile_dir, "*.prof"))
+        if not stats_files:
+            return None, []
+        report_path = os.path.join(self.profile_dir, "profile_report.txt")
+        with open(report_path, 'w') as f:
+            stats = pstats.Stats(*stats_files, stream=f)
+            stats.sort_stats("tottime").print_stats(top)
+            stats.sort_stats("cumulative").print_stats(top)
+        hot_functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:10]
+        hot_functions = [f"{total_time:.3f}s {function} ({os.path.basename(filename)}:{line})" for (filename, line, function), (_, _, total_time, _, _) in hot_functions]
+
+        # Collapsed stacks ("frame;frame;frame count") as read by flamegraph.pl and speedscope
+        collapsed_counts = {}
+        for collapsed_file in glob.glob(os.path.join(self.profile_dir, "*.collapsed")):
+            with open(collapsed_file, 'r') as f:
+                for line in f:
+                    stack, count = line.rstrip("\n").rsplit(" ", 1)
+                    collapsed_counts[stack] = collapsed_counts.get(stack, 0) + int(count)
+        if collapsed_counts:
+            with open(os.path.join(self.profile_dir, "stacks.collapsed"), 'w') as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in sorted(collapsed_counts.items()))
+        return report_path, hot_functions
+
+# The 00n loaders. Each one only names its schema, the table is the dataset the schema describes.
+class LoaderConfig:
+    def __init__(self):
+        load_dotenv("../.env")
+        self.logsdir = os.getenv("logsdir")
+        self.schemadir = os.getenv("schemadir")
+        self.bulk_load_profile = os.getenv("bulkLoadProfile", "default")
+        self.bulk_load_commit_rows = os.getenv("bulkLoadCommitRows")
+        self.load_engine = os.getenv("loadEngine", "auto")
+        self.insert_batch_rows = os.getenv("insertBatchRows", "5000")
+        self.insert_connections = os.getenv("insertConnections", "4")
+        os.makedirs(self.logsdir, exist_ok=True)
+
+    def get_schema_data(self, script_basename_without_ext):
+        with open(fr"{self.schemadir}\{script_basename_without_ext}.json", 'r') as f:
+            schema_data = json.load(f)
+        return schema_data
+
+    def get_dataset_name(self, schema_data):
+        return list(schema_data.keys())[0]
+
+    def get_bulk_load_profile(self):
+        if self.bulk_load_profile not in BULK_LOAD_PROFILES:
+            raise ValueError(f"Unknown bulk load profile '{self.bulk_load_profile}', expected one of {list(BULK_LOAD_PROFILES)}")
+        profile = dict(BULK_LOAD_PROFILES[self.bulk_load_profile], name=self.bulk_load_profile)
+        if self.bulk_load_commit_rows:
+            profile["commit_rows"] = int(self.bulk_load_commit_rows)
+        return profile
+
+    def get_load_engine(self):
+        if self.load_engine not in LOAD_ENGINES:
+            raise ValueError(f"Unknown load engine '{self.load_engine}', expected one of {list(LOAD_ENGINES)}")
+        return {"engine": self.load_engine, "batch_rows": int(self.insert_batch_rows), "connections": int(self.insert_connections)}
+
+class LoaderLogger:
+    def __init__(self, datasetName, logsdir):
+        log_file = f"{logsdir}/log_PROD_staging_{datasetName}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filename=log_file)
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+        console_handler.setFormatter(console_formatter)
+        logging.getLogger().addHandler(console_handler)
+
+class Database:
+    def __init__(self):
+        self.mysql_host = os.getenv("mysqlHost")
+        self.mysql_port = os.getenv("mysqlPort")
+        self.mysql_username = os.getenv("mysqlUsername")
+        self.mysql_password = os.getenv("mysqlPassword")
+        self.mysql_database = os.getenv("mysqlDatabase")
+
+    def connect(self):
+        return mysql.connector.connect(
+            host=self.mysql_host,
+            port=self.mysql_port,
+            user=self.mysql_username,
+            password=self.mysql_password,
+            database=self.mysql_database,
+            allow_local_infile=True
+        )
+
+class CSVToMySQL:
+    def __init__(self, csv_dir, schema, db, profile, metrics_file, load_engine, profiler=None):
+        self.csv_dir = csv_dir
+        self.table_name = list(schema.keys())[0]
+        # Columns listed in the schema's optional "drop_columns" are removed by 000_split_chunk.py
+        dropped_columns = set(schema.get("drop_columns", []))
+        self.schema = {column_name: data_type for column_name, data_type in schema[self.table_name].items() if column_name not in dropped_columns}
+        self.indexes = schema.get("indexes", {})
+        # Cleaned chunks (schema "cleaning" block) carry real NULLs written as \N by 000_split_chunk.py
+        self.null_clause = "NULL" if "cleaning" in schema else "NOT NULL"
+        check_cluster_key(schema)
+        self.key_columns = get_key_columns(schema)
+        self.db = db
+        self.profile = profile
+        self.metrics_file = metrics_file
+        self.load_engine = load_engine
+        self.profiler = profiler
+        self.indexes_deferred = profile["defer_indexes"]
+
+    def generate_partition_name(self, partition_date):
+        return "p_unknown" if partition_date == UNKNOWN_PARTITION else f"p{partition_date.replace('-', '')}"
+
+    def generate_partition_value(self, partition_date):
+        return "NULL" if partition_date == UNKNOWN_PARTITION else f"'{partition_date}'"
+
+    def generate_partition_definitions(self, partition_dates):
+        return ', '.join(f'PARTITION {self.generate_partition_name(partition_date)} VALUES IN ({self.generate_partition_value(partition_date)})' for partition_date in partition_dates)
+
+    def list_partition_dates(self, selected_dates=None):
+        table_dir = os.path.join(self.csv_dir, self.table_name)
+        partition_dates = sorted(dirname[len("date="):] for dirname in os.listdir(table_dir) if dirname.startswith("date="))
+        if selected_dates:
+            missing_dates = set(selected_dates) - set(partition_dates)
+            if missing_dates:
+                raise ValueError(f"No split output for partition(s) {sorted(missing_dates)} in {table_dir}")
+            partition_dates = sorted(selected_dates)
+        return partition_dates
+
+    def add_missing_partitions(self, cursor, partition_dates):
+        cursor.execute(f"SELECT PARTITION_NAME FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{self.table_name}'")
+        existing_partitions = {row[0] for row in cursor.fetchall()}
+        missing_dates = [partition_date for partition_date in partition_dates if self.generate_partition_name(partition_date) not in existing_partitions]
+        if missing_dates:
+            cursor.execute(f"ALTER TABLE {self.table_name} ADD PARTITION ({self.generate_partition_definitions(missing_dates)})")
+            logging.info(f"Added partition(s) for {missing_dates} to {self.table_name}.")
+
+    def create_table(self, partition_dates=None, replace=True):
+        try:
+            conn = self.db.connect()
+            cursor = conn.cursor()
+            drop_table_query = f"DROP TABLE IF EXISTS {self.table_name};"
+            columns = ', '.join(
+                f'{column_name} {data_type} {"NOT NULL" if column_name in self.key_columns else self.null_clause}'
+                for column_name, data_type in self.schema.items()
+            )
+            partition_clause = ""
+            if partition_dates is None and self.key_columns:
+                # InnoDB clusters rows on the primary key, 000_split_chunk.py --sort delivers them in that order.
+                # LOAD DATA LOCAL and INSERT IGNORE skip rows with a duplicate key, extract_from_csv logs how many.
+                columns += f', PRIMARY KEY ({", ".join(self.key_columns)})'
+            if partition_dates is not None:
+                columns += f', {PARTITION_COLUMN} DATE NULL'
+                partition_clause = f"PARTITION BY LIST COLUMNS({PARTITION_COLUMN}) ({self.generate_partition_definitions(partition_dates)})"
+            # Indexes are only deferred when the table is rebuilt, a partial reload keeps the existing ones
+            self.indexes_deferred = self.profile["defer_indexes"] and replace
+            if not self.indexes_deferred:
+                columns += ''.join(f', INDEX {index_name} ({index_columns})' for index_name, index_columns in self.indexes.items())
+            create_table_query = f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (
+                {columns}
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci ROW_FORMAT=COMPRESSED
+            {partition_clause};
+            """
+            if replace:
+                cursor.execute(drop_table_query)
+            cursor.execute(create_table_query)
+            if not replace:
+                self.add_missing_partitions(cursor, partition_dates)
+            conn.close()
+            print("\n")
+            logging.info(f"[[ {self.table_name.upper()} ]]")
+            logging.info(f"Table {self.db.mysql_database}.{self.table_name} created successfully.")
+        except mysql.connector.Error as error:
+            logging.error(f"An error occurred while creating the table: {error}")
+            raise
+
+    def create_deferred_indexes(self, cursor):
+        for index_name, index_columns in self.indexes.items():
+            start_time = time.time()
+            cursor.execute(f"ALTER TABLE {self.table_name} ADD INDEX {index_name} ({index_columns})")
+            logging.info(f"Index {index_name} ({index_columns}) created in {time.time() - start_time:.2f} seconds.")
+
+    def list_chunk_files(self, partition_dates=None):
+        chunk_files = []
+        if partition_dates is None:
+            for filename in os.listdir(self.csv_dir):
+                if filename.startswith(self.table_name) and filename.endswith(".csv"):
+                    print(f"Does '{filename}' start with '{self.table_name}': {filename.startswith(self.table_name)}")
+                    print(f"Does '{filename}' end with '.csv': {filename.endswith('.csv')}")
+                    chunk_files.append((os.path.join(self.csv_dir, filename), None))
+            return chunk_files
+
+        for partition_date in partition_dates:
+            partition_dir = os.path.join(self.csv_dir, self.table_name, f"date={partition_date}")
+            for filename in sorted(os.listdir(partition_dir)):
+                if filename.endswith(".csv"):
+                    chunk_files.append((os.path.join(partition_dir, filename), partition_date))
+        return chunk_files
+
+    def insert_chunk_files(self, chunk_files):
+        columns = list(self.schema.keys())
+        tasks = [
+            (self.db, self.table_name, columns, csv_file_path,
+             self.generate_partition_name(partition_date) if partition_date is not None else None,
+             partition_date if partition_date not in (None, UNKNOWN_PARTITION) else None,
+             self.profile, self.load_engine["batch_rows"], self.profiler)
+            for csv_file_path, partition_date in chunk_files
+        ]
+        connections = min(self.load_engine["connections"], len(tasks))
+        logging.info(f"Inserting {len(tasks)} chunk file(s) over {connections} connection(s) in batches of {self.load_engine['batch_rows']} rows.")
+        # Forked workers would inherit the parent's running profiler, spawned ones start without it
+        with get_context("spawn" if self.profiler else None).Pool(processes=connections) as pool:
+            results = pool.map(insert_chunk_file, tasks)
+        skipped_rows = 0
+        for (csv_file_path, _), (row_count, _, rows_read) in zip(chunk_files, results):
+            logging.info(f"Inserted {row_count} rows from {csv_file_path}")
+            if rows_read > row_count:
+                logging.warning(f"Skipped {rows_read - row_count} row(s) of {csv_file_path} with a duplicate key or a rejected value.")
+                skipped_rows += rows_read - row_count
+        return sum(row_count for row_count, _, _ in results), sum(batches for _, batches, _ in results), skipped_rows
+
+    def record_metrics(self, metrics):
+        logging.info(f"Run metrics: {metrics}")
+        with open(self.metrics_file, 'a') as f:
+            f.write(json.dumps(metrics) + "\n")
+
+    def extract_from_csv(self, partition_dates=None):  # sourcery skip: raise-specific-error
+        try:
+            logging.info(f"Starting import of data from CSV files to {self.table_name}")
+            logging.info(f"Using bulk load profile '{self.profile['name']}'.")
+            start_time = time.time()
+            conn = self.db.connect()
+            cursor = conn.cursor()
+            if partition_dates is None:
+                truncate_query = f"TRUNCATE TABLE {self.table_name}"
+                cursor.execute(truncate_query)
+                logging.info(f"Table {self.table_name} truncated.")
+            else:
+                partition_names = ', '.join(self.generate_partition_name(partition_date) for partition_date in partition_dates)
+                truncate_query = f"ALTER TABLE {self.table_name} TRUNCATE PARTITION {partition_names}"
+                cursor.execute(truncate_query)
+                logging.info(f"Partition(s) {partition_names} of {self.table_name} truncated.")
+            
+            total_rows_imported = 0
+            pending_rows = 0
+            chunks_loaded = 0
+            commits = 0
+            skipped_rows = 0
+
+            engine = select_load_engine(cursor, self.load_engine["engine"])
+            engines_used = []
+            chunk_files = self.list_chunk_files(partition_dates)
+            insert_files = chunk_files if engine == "insert" else []
+
+            session = BulkLoadSession(cursor, self.profile)
+            session.apply()
+            try:
+                for position, (csv_file_path, partition_date) in enumerate([] if insert_files else chunk_files):
+                    columns = ', '.join(self.schema.keys())
+                    partition_clause = ""
+                    set_clause = ""
+                    if partition_date is not None:
+                        partition_clause = f" PARTITION ({self.generate_partition_name(partition_date)})"
+                        set_clause = f"SET {PARTITION_COLUMN} = {self.generate_partition_value(partition_date)}"
+                    escaped_path = csv_file_path.replace('\\', '\\\\')
+                    load_data_query = f"""
+                    LOAD DATA LOCAL INFILE '{escaped_path}'
+                    INTO TABLE {self.table_name}{partition_clause}
+                    CHARACTER SET utf8mb4
+                    FIELDS TERMINATED BY ','
+                    OPTIONALLY ENCLOSED BY '"'
+                    LINES TERMINATED BY '\\n'
+                    IGNORE 1 LINES
+                    (
+                        {columns}
+                    )
+                    {set_clause}
+                    """
+                    logging.info(f"Executing query: {load_data_query}")
+                    try:
+                        cursor.execute(load_data_query)
+                    except mysql.connector.Error as error:
+                        if self.load_engine["engine"] != "auto" or error.errno not in LOCAL_INFILE_ERRNOS:
+                            raise
+                        logging.warning(f"LOAD DATA LOCAL INFILE was rejected ({error}), loading the remaining files with batched INSERTs.")
+                        insert_files = chunk_files[position:]
+                        break
+                    if "infile" not in engines_used:
+                        engines_used.append("infile")
+                    row_count = cursor.rowcount
+                    total_rows_imported += row_count
+                    if self.key_columns and partition_date is None:
+                        # LOAD DATA LOCAL acts as IGNORE, rows repeating a primary key are dropped with only a warning
+                        duplicate_rows = count_records(csv_file_path) - row_count
+                        if duplicate_rows > 0:
+                            logging.warning(f"Skipped {duplicate_rows} row(s) of {csv_file_path} with a duplicate {', '.join(self.key_columns)}.")
+                            skipped_rows += duplicate_rows
+                    if row_count == 0:
+                        logging.warning(f"No data was imported from {csv_file_path}")
+                    else:
+                        logging.info(f"Imported {row_count} rows from {csv_file_path}")
+                    chunks_loaded += 1
+                    pending_rows += row_count
+                    if self.profile["commit_rows"] is not None and pending_rows >= self.profile["commit_rows"]:
+                        conn.commit()
+                        commits += 1
+                        pending_rows = 0
+                        logging.info(f"Committed after {csv_file_path}.")
+
+                if insert_files:
+                    if pending_rows:
+                        conn.commit()
+                        commits += 1
+                        pending_rows = 0
+                    inserted_rows, insert_batches, insert_skipped_rows = self.insert_chunk_files(insert_files)
+                    engines_used.append("insert")
+                    total_rows_imported += inserted_rows
+                    skipped_rows += insert_skipped_rows
+                    chunks_loaded += len(insert_files)
+                    commits += insert_batches
+            
+                if total_rows_imported == 0:
+                    raise Exception("No data was imported. Exiting program.")
+            
+                if pending_rows or commits == 0:
+                    conn.commit()
+                    commits += 1
+                logging.info("Changes committed to the database.")
+                if skipped_rows:
+                    logging.warning(f"{skipped_rows} row(s) were skipped in total, see the warnings above.")
+            finally:
+                session.restore()
+
+            if self.indexes_deferred:
+                self.create_deferred_indexes(cursor)
+            conn.close()
+            logging.info("Database connection closed.")
+            
+            logging.info("All data imported successfully.")
+            self.record_metrics({
+                "table": self.table_name,
+                "profile": self.profile,
+                "engine": "+".join(engines_used),
+                "session_variables_applied": list(session.saved_variables),
+                "partitions": partition_dates,
+                "chunks": chunks_loaded,
+                "rows": total_rows_imported,
+                "skipped_rows": skipped_rows,
+                "commits": commits,
+                "seconds": round(time.time() - start_time, 3),
+                "finished_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
+        except mysql.connector.Error as error:
+            logging.error(f"An error occurred while importing data: {error}")
+            raise
+
+# Every 00n loader runs this with the name of its schema file ({schemadir}\{schema_name}.json)
+def run_loader(schema_name):
+    parser = argparse.ArgumentParser(description="Load split CSV files into MySQL.")
+    parser.add_argument("--layout", choices=["rows", "date"], default="rows",
+                        help="rows: {table}_{n}.csv chunks, date: {table}/date=YYYY-MM-DD/part-{n}.csv partitions from 000_split_chunk.py --layout date")
+    parser.add_argument("--partitions", nargs="+", metavar="YYYY-MM-DD",
+                        help="With --layout date, reload only these partitions and keep the rest of the table")
+    parser.add_argument("--profile", action="store_true",
+                        help="Run the load under cProfile and write {logsdir}/profile_{timestamp}/profile_report.txt")
+    parser.add_argument("--profile-stacks", action="store_true",
+                        help="With --profile, also sample call stacks into stacks.collapsed for flamegraphs")
+    args = parser.parse_args()
+    if args.partitions and args.layout != "date":
+        parser.error("--partitions requires --layout date")
+
+    config = LoaderConfig()
+    schema_data = config.get_schema_data(schema_name)
+    datasetName = config.get_dataset_name(schema_data)
+
+    db = Database()
+    LoaderLogger(datasetName, config.logsdir)
+
+    csv_dirInit = os.getenv("outdir")
+    csv_dir = fr'{csv_dirInit}\\'
+
+    profile = config.get_bulk_load_profile()
+    load_engine = config.get_load_engine()
+    metrics_file = os.path.join(config.logsdir, "load_metrics.jsonl")
+
+    profiler = None
+    if args.profile:
+        profiler = WorkerProfiler(os.path.join(config.logsdir, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}"), args.profile_stacks)
+
+    csv_to_mysql = CSVToMySQL(csv_dir, schema_data, db, profile, metrics_file, load_engine, profiler)
+
+    def run_load():
+        if args.layout == "date":
+            partition_dates = csv_to_mysql.list_partition_dates(args.partitions)
+            csv_to_mysql.create_table(partition_dates, replace=not args.partitions)
+            csv_to_mysql.extract_from_csv(partition_dates)
+        else:
+            csv_to_mysql.create_table()
+            csv_to_mysql.extract_from_csv()
+
+    if profiler is not None:
+        # INSERT engine workers profile themselves into the same directory, merge() picks them up
+        try:
+            profiler.run(datasetName, run_load)
+        finally:
+            report_path, hot_functions = profiler.merge()
+            logging.info(f"Profile report: {report_path}")
+            for hot_function in hot_functions:
+                logging.info(f"  {hot_function}")
+    else:
+        run_load()